@@ -0,0 +1,94 @@
+"""
+Behaviour checks for IncrementalRowParser (extract_metadata_to_manifest.py --stream).
+
+Every reply is fed in 1-, 3- and 100-character chunks and must give the same
+rows, or be rejected. For the early-abort cases the check also asserts that the
+parser gave up before the end of the reply, so off-schema output stops costing
+tokens as soon as it is recognisable.
+
+    python bench/check_stream_parser.py
+
+Needs the script's own dependencies (pandas, PyMuPDF, openai) to import it.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("GPT_KEY", "sk-check")  # the OpenAI client is built at import
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extract_metadata_to_manifest as extract  # noqa: E402
+
+FIELDS = ["person_id", "name", "email"]
+PADDING = '{"name": "' + "x" * 200 + '"}'  # content the parser should never need to read
+
+# (reply, expected rows)
+ACCEPTED = [
+    ('[{"person_id": "p1", "name": "Ann"}, {"person_id": "p2", "name": "Bo"}]',
+     [{"person_id": "p1", "name": "Ann"}, {"person_id": "p2", "name": "Bo"}]),
+    ('```json\n[{"person_id": "p1"}]\n```', [{"person_id": "p1"}]),
+    ('[{"person_id": "p1", "name": "say \\"}]\\" {["}]', [{"person_id": "p1", "name": 'say "}]" {['}]),
+    ('[{"person_id": "p1", "extra": 1}]', [{"person_id": "p1", "extra": 1}]),
+    ('[]', []),
+    ('  [ ] trailing prose is ignored', []),
+    ('{"person_id": "p1", "extra": 1}',
+     [{"person_id": "p1", "name": "Not Provided", "email": "Not Provided"}]),
+    ('{"person": [{"person_id": "p1"}, {"person_id": "p2", "name": "Bo"}]}',
+     [{"person_id": "p1"}, {"person_id": "p2", "name": "Bo"}]),
+    ('{"person": []}', []),
+]
+
+# (reply, must stop before the end of the reply)
+REJECTED = [
+    ("Here is the JSON you asked for: " + PADDING, True),
+    ('[{"person_id": "p1"}, Sorry, the rest is in the text. ' + PADDING, True),
+    ('[{"summary": "' + "y" * 200 + '"}]', True),
+    ('[{"person_id": "p1", "name": ["Ann", "Bo"], ' + PADDING[1:] + "]", True),
+    ('{"person": {"person_id": "p1"}, ' + PADDING[1:], True),
+    ('{"person": "see below", ' + PADDING[1:], True),
+    ('{"person": [{"person_id": "p1"}], "notes": ' + PADDING + "}", True),
+    ('[{"person_id": "p1"},]', False),
+    ('[{"person_id": "p1"}', False),
+    ('[{"person_id": "p1"}}]', False),
+    ("```json\n", False),
+]
+
+
+def feed(reply, chunk_size):
+    """Return ('ok', rows) or ('rejected', characters fed before the error)."""
+    parser = extract.IncrementalRowParser(FIELDS)
+    rows, fed = [], 0
+    try:
+        while fed < len(reply) and not parser.done:
+            rows += parser.feed(reply[fed:fed + chunk_size])
+            fed = min(fed + chunk_size, len(reply))
+        parser.close()
+    except extract.MalformedReplyError:
+        return "rejected", fed
+    return "ok", rows
+
+
+def main():
+    failures = []
+    for chunk_size in (1, 3, 100):
+        for reply, expected in ACCEPTED:
+            result = feed(reply, chunk_size)
+            if result != ("ok", expected):
+                failures.append(f"chunk {chunk_size}: {reply[:50]!r} gave {result}")
+        for reply, early in REJECTED:
+            status, fed = feed(reply, chunk_size)
+            if status != "rejected":
+                failures.append(f"chunk {chunk_size}: {reply[:50]!r} was accepted")
+            elif early and chunk_size < 100 and fed >= len(reply):
+                failures.append(f"chunk {chunk_size}: {reply[:50]!r} only rejected at the end")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    cases = 3 * (len(ACCEPTED) + len(REJECTED))
+    print(f"{'❌' if failures else '✅'} {cases - len(failures)}/{cases} parser checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Local stand-ins for the external services the scripts talk to, so they can be
+benchmarked offline:
+
+* a publisher server mimicking Unpaywall, doi.org redirects, publisher landing
+  pages (cookie banner + PDF link, optionally missing) and PDF downloads;
+* an OpenAI-compatible ``/v1/chat/completions`` endpoint (plain or streamed)
+  with configurable latency, 429 rate and rates of malformed replies and of
+  replies wrapped in an object (``{"person": [...]}``).
+
+Only the standard library is used so the mocks start instantly and add no
+measurable overhead to the code under test.
+"""
+
+import ast
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+# ---------------------------------------------------------------------------
+#  Synthetic content
+# ---------------------------------------------------------------------------
+
+LOREM = (
+    "Single-cell RNA sequencing of Arabidopsis thaliana root tips was performed "
+    "using the 10x Genomics Chromium platform. Protoplasts were isolated by "
+    "enzymatic digestion, filtered and loaded at 1000 cells per microlitre. "
+    "Libraries were sequenced on an Illumina NovaSeq 6000 to a depth of 50000 "
+    "reads per cell."
+)
+
+
+def bench_dois(n: int) -> list:
+    """Deterministic, obviously fake DOIs for a run of ``n`` papers."""
+    return [f"10.5555/bench.{i:05d}" for i in range(n)]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf_bytes(title: str, pages: int = 5, lines_per_page: int = 60) -> bytes:
+    """
+    Build a small but valid multi-page PDF containing extractable text.
+    Hand-written so the mocks do not need PyMuPDF.
+    """
+    words = LOREM.split()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page_no in range(pages):
+        lines = [f"{title} - page {page_no + 1}"]
+        for line_no in range(lines_per_page - 1):
+            start = (page_no * lines_per_page + line_no) % len(words)
+            lines.append(" ".join((words + words)[start:start + 14]))
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+            f"({_pdf_escape(line)}) Tj T*" for line in lines
+        ) + " ET"
+        stream = stream.encode("latin-1")
+        content_no = len(objects) + 2
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_no} 0 R >>".encode()
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref_at
+    )
+    return bytes(out)
+
+
+LANDING_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>{doi}</title></head>
+<body>
+  <div id="onetrust-banner-sdk" style="position:fixed;bottom:0;width:100%;background:#eee">
+    We use cookies to improve your experience.
+    <button id="onetrust-accept-btn-handler"
+            onclick="document.getElementById('onetrust-banner-sdk').remove()">Accept all</button>
+  </div>
+  <h1>Single-cell atlas {doi}</h1>
+  <p>{text}</p>
+  {pdf_link}
+</body>
+</html>
+"""
+
+
+# ---------------------------------------------------------------------------
+#  Request handlers
+# ---------------------------------------------------------------------------
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - stdlib signature
+        pass
+
+    def _send(self, status, body=b"", content_type="text/plain", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PublisherHandler(_QuietHandler):
+    """Unpaywall (``/v2/<doi>``), doi.org (``/doi/<doi>``), landing pages and PDFs."""
+
+    config = None  # set by start_publisher_server
+
+    def do_GET(self):
+        cfg = self.config
+        if cfg["latency"]:
+            time.sleep(cfg["latency"])
+        path = unquote(urlsplit(self.path).path)
+        base = f"http://{self.headers.get('Host')}"
+
+        if path.startswith("/v2/"):
+            doi = path[len("/v2/"):]
+            # Deterministic per DOI so repeated runs hit the same code paths
+            open_access = zlib.crc32(doi.encode()) % 1000 < cfg["oa_rate"] * 1000
+            location = {"url_for_pdf": f"{base}/pdf/{doi}.pdf"} if open_access else None
+            self._send(200, json.dumps({"doi": doi, "best_oa_location": location}),
+                       "application/json")
+        elif path.startswith("/doi/"):
+            doi = path[len("/doi/"):]
+            self._send(302, headers={"Location": f"{base}/landing/{doi}"})
+        elif path.startswith("/landing/"):
+            doi = path[len("/landing/"):]
+            # Hashed differently from the Unpaywall decision so the two are independent
+            has_pdf = zlib.crc32(doi.encode()[::-1]) % 1000 >= cfg["no_pdf_rate"] * 1000
+            pdf_link = f'<a class="pdf-link" href="/pdf/{doi}.pdf">Download PDF</a>' if has_pdf else ""
+            self._send(200, LANDING_PAGE.format(doi=doi, text=LOREM, pdf_link=pdf_link),
+                       "text/html; charset=utf-8")
+        elif path.startswith("/pdf/") and path.endswith(".pdf"):
+            filename = path[len("/pdf/"):].replace("/", "_")
+            self._send(200, cfg["pdf_bytes"], "application/pdf",
+                       {"Content-Disposition": f'attachment; filename="{filename}"'})
+        else:
+            self._send(404, "not found")
+
+
+class OpenAIHandler(_QuietHandler):
+    """
+    Minimal ``POST /v1/chat/completions`` returning one JSON row list per sheet.
+    With ``"stream": true`` the reply is sent as server-sent events, spreading
+    the configured latency over the chunks. ``completion_chars`` counts the
+    reply characters actually delivered, so early-aborted streams show up as
+    fewer wasted tokens.
+    """
+
+    config = None  # set by start_openai_server
+
+    def do_POST(self):
+        cfg = self.config
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if urlsplit(self.path).path.rstrip("/") != "/v1/chat/completions":
+            self._send(404, "not found")
+            return
+
+        with cfg["lock"]:
+            rate_limited = cfg["rng"].random() < cfg["rate_429"]
+            malformed = cfg["rng"].random() < cfg["malformed_rate"]
+            wrapped = cfg["rng"].random() < cfg["wrapped_rate"]
+            cfg["calls"] += 1
+        if rate_limited:
+            self._send(
+                429,
+                json.dumps({"error": {"message": "Rate limit reached (mock)",
+                                      "type": "requests", "code": "rate_limit_exceeded"}}),
+                "application/json",
+                {"retry-after-ms": str(cfg["retry_after_ms"])},
+            )
+            return
+
+        sheet, rows = self._rows_for(payload.get("messages") or [])
+        reply = json.dumps(rows)
+        if wrapped:
+            # Valid JSON, but the rows sit under the sheet name instead of at the top level
+            reply = json.dumps({sheet: rows})
+        elif malformed:
+            # Starts out fine, then drifts into prose for about as long again
+            first = json.dumps(rows[:1])[:-1]
+            reply = first + ", Note: the remaining samples are described in the text. " + LOREM * (len(reply) // len(LOREM) + 1)
+        if payload.get("stream"):
+            self._stream(payload, reply)
+            return
+
+        if cfg["latency"]:
+            time.sleep(cfg["latency"])
+        with cfg["lock"]:
+            cfg["completion_chars"] += len(reply)
+        body = {
+            "id": f"chatcmpl-mock-{cfg['calls']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(reply) // 4,
+                      "total_tokens": len(reply) // 4},
+        }
+        self._send(200, json.dumps(body), "application/json")
+
+    def _stream(self, payload, reply):
+        cfg = self.config
+        pieces = [reply[i:i + cfg["stream_chunk_chars"]]
+                  for i in range(0, len(reply), cfg["stream_chunk_chars"])]
+        delay = cfg["latency"] / max(len(pieces), 1)
+        chunk = {
+            "id": f"chatcmpl-mock-{cfg['calls']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+        }
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for piece in pieces + [None]:
+                if piece is not None and delay:
+                    time.sleep(delay)
+                choice = ({"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                          if piece is not None else
+                          {"index": 0, "delta": {}, "finish_reason": "stop"})
+                self.wfile.write(b"data: " + json.dumps({**chunk, "choices": [choice]}).encode() + b"\n\n")
+                self.wfile.flush()
+                if piece is not None:
+                    with cfg["lock"]:
+                        cfg["completion_chars"] += len(piece)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped the generation early
+
+    def _rows_for(self, messages):
+        prompt = messages[-1]["content"] if messages else ""
+        sheet = re.search(r"for the '([^']+)' worksheet", prompt)
+        sheet = sheet.group(1) if sheet else "sheet"
+        try:
+            fields = ast.literal_eval(prompt.split("Fields:\n", 1)[1])
+        except (IndexError, ValueError, SyntaxError):
+            fields = []
+        return sheet, [
+            {field: f"{sheet}_{field}_{row}" for field in fields}
+            for row in range(self.config["rows_per_sheet"])
+        ]
+
+
+# ---------------------------------------------------------------------------
+#  Server start-up
+# ---------------------------------------------------------------------------
+
+def _serve(handler_cls, config, host, port):
+    handler = type(handler_cls.__name__, (handler_cls,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def start_publisher_server(latency=0.0, oa_rate=0.5, no_pdf_rate=0.0, pdf_pages=5,
+                           host="127.0.0.1", port=0):
+    """Start the publisher mock in a background thread; returns ``(server, base_url)``."""
+    config = {
+        "latency": latency,
+        "oa_rate": oa_rate,
+        "no_pdf_rate": no_pdf_rate,
+        "pdf_bytes": make_pdf_bytes("Mock single-cell paper", pages=pdf_pages),
+    }
+    return _serve(PublisherHandler, config, host, port)
+
+
+def start_openai_server(latency=0.05, rate_429=0.0, malformed_rate=0.0, wrapped_rate=0.0,
+                        rows_per_sheet=2, seed=0, retry_after_ms=20, stream_chunk_chars=16,
+                        host="127.0.0.1", port=0):
+    """Start the chat-completions mock in a background thread; returns ``(server, base_url)``."""
+    config = {
+        "latency": latency,
+        "rate_429": rate_429,
+        "malformed_rate": malformed_rate,
+        "wrapped_rate": wrapped_rate,
+        "rows_per_sheet": rows_per_sheet,
+        "retry_after_ms": retry_after_ms,
+        "stream_chunk_chars": stream_chunk_chars,
+        "rng": random.Random(seed),
+        "lock": threading.Lock(),
+        "calls": 0,
+        "completion_chars": 0,
+    }
+    return _serve(OpenAIHandler, config, host, port)
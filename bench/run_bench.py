@@ -0,0 +1,277 @@
+"""
+Offline throughput benchmark for the download and extraction scripts.
+
+Starts the mock publisher and OpenAI servers from ``mock_servers.py``, then runs
+each target script in a fresh subprocess (its own temporary working directory,
+so ``pdfs/``, ``done/`` etc. never touch the real ones) at several paper counts
+and reports papers/min, p50/p95 per-paper latency, peak RSS and (for extract)
+the completion tokens the mock LLM delivered. Peak RSS is given for the
+worker's Python process ("RSS MB") and, for the playwright target only, for
+its largest child process, the Playwright driver or Firefox ("child MB"). The
+other targets start no real child workload; their only children are helpers
+forked by libraries, which would just repeat the parent's memory.
+
+    python bench/run_bench.py                                  # all targets, 10/100/1000 papers
+    python bench/run_bench.py --targets extract --scales 10 100 --llm-latency 0.2 --llm-429-rate 0.05
+    python bench/run_bench.py --targets extract --scales 10 --llm-malformed-rate 0.2 --stream
+    python bench/run_bench.py --targets extract --scales 10 --llm-wrapped-rate 0.5 --stream
+    python bench/check_stream_parser.py                        # parser behaviour checks
+    python bench/run_bench.py --serve-only                     # just run the mocks
+
+Targets:
+    get_pdf     get_pdf_from_doi.py (requests + BeautifulSoup)
+    playwright  get_pdf_from_doi_using_playwright.py (needs `playwright install firefox`)
+    extract     extract_metadata_to_manifest.py (PyMuPDF + OpenAI + openpyxl)
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_servers import bench_dois, make_pdf_bytes, start_openai_server, start_publisher_server
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TARGETS = ["get_pdf", "playwright", "extract"]
+
+# Sheets and a representative subset of their columns for the synthetic template
+TEMPLATE_SHEETS = {
+    "study": ["study_id", "title", "description", "publication_doi", "optional_funding"],
+    "person": ["person_id", "study_id", "name", "email", "affiliation", "role"],
+    "sample": ["sample_id", "study_id", "organism", "tissue", "developmental_stage"],
+    "dissociation": ["dissociation_id", "sample_id", "protocol", "enzyme", "duration"],
+    "cell_suspension": ["cell_suspension_id", "dissociation_id", "cell_count", "viability"],
+    "lib_prep": ["lib_prep_id", "cell_suspension_id", "platform", "chemistry", "kit"],
+    "sequencing": ["sequencing_id", "lib_prep_id", "instrument", "read_length", "depth"],
+}
+
+
+# ---------------------------------------------------------------------------
+#  Worker side: runs inside the subprocess, imports and times one target
+# ---------------------------------------------------------------------------
+
+def _peak_rss_mb(children=False) -> float:
+    import resource
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _time_each(items, fn):
+    latencies, failures = [], 0
+    for item in items:
+        start = time.perf_counter()
+        try:
+            ok = fn(item)
+        except Exception as e:
+            print(f"❌ {item}: {e!r}")
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        failures += ok is False
+    return latencies, failures
+
+
+def _write_template(path):
+    from openpyxl import Workbook
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet, columns in TEMPLATE_SHEETS.items():
+        wb.create_sheet(sheet).append(columns)
+    wb.save(path)
+
+
+def run_worker(args):
+    sys.path.insert(0, str(REPO_ROOT))
+    os.environ.setdefault("GPT_KEY", "sk-bench")
+    os.environ["OPENAI_BASE_URL"] = f"{args.llm_url}/v1"
+    dois = bench_dois(args.n)
+
+    if args.worker == "extract":
+        pdf_dir = Path("pdfs")
+        pdf_dir.mkdir(exist_ok=True)
+        Path("completed_manifests").mkdir(exist_ok=True)
+        pdf_bytes = make_pdf_bytes("Mock single-cell paper", pages=args.pdf_pages)
+        for doi in dois:
+            (pdf_dir / (doi.replace("/", "_") + ".pdf")).write_bytes(pdf_bytes)
+
+    finish = None
+    start = time.perf_counter()
+    if args.worker == "get_pdf":
+        import get_pdf_from_doi as target
+        target.UNPAYWALL_API_URL = f"{args.publisher_url}/v2"
+        target.DOI_RESOLVER_URL = f"{args.publisher_url}/doi"
+        target.POLITE_DELAY = 0
+        fn, items = target.fetch_pdf_for_doi, dois
+    elif args.worker == "playwright":
+        import get_pdf_from_doi_using_playwright as target
+        target.DOI_RESOLVER_URL = f"{args.publisher_url}/doi"
+        target.HEADLESS = True
+        fn, items = target.download_pdf_with_playwright, dois
+        finish = target.diagnostics.close  # include queued diagnostics in the wall time
+    else:
+        import extract_metadata_to_manifest as target
+        _write_template(target.excel_file)
+        template_fields = target.load_template_fields(target.excel_file)
+        fn = lambda pdf: target.process_pdf(pdf, template_fields, args.stream)  # noqa: E731
+        items = sorted(Path("pdfs").glob("*.pdf"))
+    startup = time.perf_counter() - start
+
+    latencies, failures = _time_each(items, fn)
+    if finish:
+        finish()
+    result = {
+        "startup_s": startup,
+        "wall_s": time.perf_counter() - start,
+        "latencies_s": latencies,
+        "failures": failures,
+        "peak_rss_mb": _peak_rss_mb(),
+        # Largest finished child: the Playwright driver or Firefox (closed per DOI)
+        "peak_child_rss_mb": _peak_rss_mb(children=True) if args.worker == "playwright" else None,
+    }
+    Path(args.result).write_text(json.dumps(result))
+
+
+# ---------------------------------------------------------------------------
+#  Driver side: starts the mocks, spawns workers and reports
+# ---------------------------------------------------------------------------
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_target(target, n, publisher_url, llm_server, llm_url, args):
+    llm_stats = llm_server.RequestHandlerClass.config
+    with llm_stats["lock"]:
+        llm_stats["completion_chars"] = 0
+    with tempfile.TemporaryDirectory(prefix=f"bench_{target}_") as workdir:
+        result_path = Path(workdir) / "result.json"
+        log_path = Path(workdir) / "worker.log"
+        cmd = [
+            sys.executable, str(Path(__file__).resolve()),
+            "--worker", target, "--n", str(n),
+            "--publisher-url", publisher_url, "--llm-url", llm_url,
+            "--pdf-pages", str(args.pdf_pages), "--result", str(result_path),
+        ] + (["--stream"] if args.stream else [])
+        with open(log_path, "w") as log:
+            proc = subprocess.run(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        if proc.returncode != 0 or not result_path.exists():
+            tail = log_path.read_text(errors="replace").splitlines()[-10:]
+            return {"target": target, "n": n, "error": "\n".join(tail)}
+        raw = json.loads(result_path.read_text())
+
+    latencies = raw["latencies_s"]
+    return {
+        "target": target,
+        "n": n,
+        "failures": raw["failures"],
+        "papers_per_min": len(latencies) / raw["wall_s"] * 60 if raw["wall_s"] else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "startup_s": raw["startup_s"],
+        "peak_rss_mb": raw["peak_rss_mb"],
+        "peak_child_rss_mb": raw["peak_child_rss_mb"],
+        "llm_completion_tokens": llm_stats["completion_chars"] // 4,
+    }
+
+
+def print_report(rows):
+    header = f"{'target':<11}{'papers':>7}{'failed':>7}{'papers/min':>12}{'p50 s':>9}{'p95 s':>9}{'start s':>9}{'RSS MB':>9}{'child MB':>10}{'LLM tok':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in rows:
+        if "error" in r:
+            print(f"{r['target']:<11}{r['n']:>7}  ❌ worker failed:\n{r['error']}")
+            continue
+        child_rss = "-" if r["peak_child_rss_mb"] is None else f"{r['peak_child_rss_mb']:.1f}"
+        print(
+            f"{r['target']:<11}{r['n']:>7}{r['failures']:>7}{r['papers_per_min']:>12.1f}"
+            f"{r['p50_s']:>9.3f}{r['p95_s']:>9.3f}{r['startup_s']:>9.2f}{r['peak_rss_mb']:>9.1f}{child_rss:>10}{r['llm_completion_tokens']:>10}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--scales", nargs="+", type=int, default=[10, 100, 1000],
+                        help="number of papers per run")
+    parser.add_argument("--publisher-latency", type=float, default=0.0,
+                        help="seconds added to every mock publisher response")
+    parser.add_argument("--oa-rate", type=float, default=0.5,
+                        help="fraction of DOIs Unpaywall reports as open access")
+    parser.add_argument("--no-pdf-rate", type=float, default=0.0,
+                        help="fraction of landing pages without a PDF link (exercises the failure path)")
+    parser.add_argument("--llm-latency", type=float, default=0.05,
+                        help="seconds per mock chat completion")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0,
+                        help="fraction of mock chat completions answered with HTTP 429")
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0,
+                        help="fraction of mock chat completions that drift from JSON into prose")
+    parser.add_argument("--llm-wrapped-rate", type=float, default=0.0,
+                        help='fraction of mock chat completions wrapped as {"<sheet>": [rows]}')
+    parser.add_argument("--stream", action="store_true",
+                        help="run extract with streamed completions (extract_metadata_to_manifest.py --stream)")
+    parser.add_argument("--rows-per-sheet", type=int, default=2)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--serve-only", action="store_true",
+                        help="start the mock servers and wait (for manual runs)")
+    # Internal: used by the driver to launch a worker subprocess
+    parser.add_argument("--worker", choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument("--n", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--publisher-url", help=argparse.SUPPRESS)
+    parser.add_argument("--llm-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+        return
+
+    _, publisher_url = start_publisher_server(
+        latency=args.publisher_latency, oa_rate=args.oa_rate,
+        no_pdf_rate=args.no_pdf_rate, pdf_pages=args.pdf_pages
+    )
+    llm_server, llm_url = start_openai_server(
+        latency=args.llm_latency, rate_429=args.llm_429_rate, malformed_rate=args.llm_malformed_rate,
+        wrapped_rate=args.llm_wrapped_rate,
+        rows_per_sheet=args.rows_per_sheet, seed=args.seed,
+    )
+    print(f"📡 Mock publisher: {publisher_url}  (Unpaywall {publisher_url}/v2, DOI resolver {publisher_url}/doi)")
+    print(f"🤖 Mock OpenAI:    {llm_url}/v1")
+
+    if args.serve_only:
+        print("Press CTRL+C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    rows = []
+    for target in args.targets:
+        for n in args.scales:
+            print(f"⏱️  {target} × {n} papers ...")
+            rows.append(run_target(target, n, publisher_url, llm_server, llm_url, args))
+    print_report(rows)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2))
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
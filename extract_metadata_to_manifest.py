@@ -1,4 +1,6 @@
 import os
+import time
+import argparse
 
 import pandas as pd
 import fitz  # PyMuPDF
@@ -11,6 +13,12 @@ import shutil
 
 # --- Config ---
 excel_file = "sc_rnaseq_mixs_v0.1_base_unprotected.xlsx"
+# sheets_to_process = ["study"]
+sheets_to_process = ["study", "person", "sample", "dissociation", "cell_suspension", "lib_prep", "sequencing"]
+# Streaming mode: how many times to re-ask GPT after aborting a malformed reply
+stream_max_attempts = 3
+# Streaming mode: a single row longer than this is treated as runaway output
+stream_max_row_chars = 20_000
 
 # --- OpenAI Client ---
 client = OpenAI(
@@ -74,12 +82,15 @@ def get_base_messages(pdf_text):
 
 
 # --- GPT query ---
-def query_gpt_for_sheet(messages, sheet_name, fields):
-    field_prompt = (
+def get_field_prompt(sheet_name, fields):
+    return (
         f"Extract the following metadata fields for the '{sheet_name}' worksheet. "
         f"Return data as JSON. Fields:\n{fields}"
     )
-    messages.append({"role": "user", "content": field_prompt})
+
+
+def query_gpt_for_sheet(messages, sheet_name, fields):
+    messages.append({"role": "user", "content": get_field_prompt(sheet_name, fields)})
     '''
     response = client.chat.completions.create(
         model="gpt4.1",
@@ -99,80 +110,422 @@ def query_gpt_for_sheet(messages, sheet_name, fields):
     return reply
 
 
-# --- Main process ---
-input_pdf_path = Path("pdfs")
-for file in input_pdf_path.iterdir():
-    if file.is_file():
-        if ".DS_Store" in file.name:
-            continue
-        updated_file = Path("completed_manifests/" + str(file.name)).with_suffix(".xlsx")
-        pdf_file = file
-        pdf_text = extract_pdf_text(pdf_file)
+# --- Streaming GPT query ---
+class MalformedReplyError(ValueError):
+    """Raised as soon as a streamed reply can no longer become valid rows."""
+
+
+class IncrementalRowParser:
+    """
+    Consumes a GPT reply chunk by chunk and returns each row (a JSON object)
+    as soon as its closing brace arrives. Accepts a top-level array of rows,
+    a single object, or a single-key object wrapping the array (e.g.
+    {"person": [...]}), optionally inside a ```json fence. Raises
+    MalformedReplyError as soon as the reply can no longer give valid rows:
+    text that is not JSON, a row whose first key is not a worksheet field,
+    or an object/array nested inside a row.
+    """
+
+    def __init__(self, fields):
+        self.field_order = list(fields)
+        self.fields = set(fields)
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"     # start -> [wrapper ->] array <-> row -> [wrapper_end ->] done
+        self.expect_row = True   # inside the array: waiting for a row rather than ',' or ']'
+        self.single_object = False
+        self.wrapped = False
+        self.wrapper_colon = False
+        self.row_count = 0
+        self.row_start = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False  # next string at depth 1 is a key
+        self.key_start = None
+        self.row_has_field = False
+
+    @property
+    def done(self):
+        return self.state == "done"
+
+    def feed(self, text):
+        self.buffer += text
+        rows = []
+        while self.pos < len(self.buffer) and self.state != "done":
+            ch = self.buffer[self.pos]
+            if self.state == "row":
+                self._scan_row(ch, rows)
+            elif ch.isspace():
+                self.pos += 1
+            elif self.state == "start":
+                if not self._scan_start(ch):
+                    break  # fence line not complete yet
+            elif self.state == "wrapper":
+                self._scan_wrapper(ch)
+            elif self.state == "wrapper_end" and ch == "}":
+                self.state = "done"
+                self.pos += 1
+            elif self.state == "array" and ch == "{" and self.expect_row:
+                self._begin_row()
+            elif self.state == "array" and ch == "," and not self.expect_row:
+                self.expect_row = True
+                self.pos += 1
+            elif self.state == "array" and ch == "]" and (not self.expect_row or self.row_count == 0):
+                self.state = "wrapper_end" if self.wrapped else "done"
+                self.pos += 1
+            else:
+                raise MalformedReplyError(f"unexpected {self.buffer[self.pos:self.pos + 40]!r} in row list")
+
+        # Drop what has been consumed so the buffer only holds the current row
+        cut = self.row_start if self.state == "row" else self.pos
+        self.buffer = self.buffer[cut:]
+        self.pos -= cut
+        self.row_start -= cut
+        if self.key_start is not None:
+            self.key_start -= cut
+        if self.state == "row" and self.pos > stream_max_row_chars:
+            raise MalformedReplyError(f"row exceeds {stream_max_row_chars} characters")
+        return rows
+
+    def close(self):
+        if not self.done:
+            raise MalformedReplyError("reply ended before the JSON was complete")
+
+    def _scan_start(self, ch):
+        if ch == "`":
+            newline = self.buffer.find("\n", self.pos)
+            if newline == -1:
+                if len(self.buffer) - self.pos > 16:
+                    raise MalformedReplyError("unterminated code fence")
+                return False
+            self.pos = newline + 1
+        elif ch == "[":
+            self.state = "array"
+            self.pos += 1
+        elif ch == "{":
+            self.single_object = True
+            self._begin_row()
+        else:
+            raise MalformedReplyError(f"expected JSON, got {self.buffer[self.pos:self.pos + 40]!r}")
+        return True
 
-        xls = pd.ExcelFile(excel_file)
-        # sheets_to_process = ["study"]
-        sheets_to_process = ["study", "person", "sample", "dissociation", "cell_suspension", "lib_prep", "sequencing"]
+    def _scan_wrapper(self, ch):
+        # After the wrapper key: only ':' and then the opening '[' may follow
+        if ch == ":" and not self.wrapper_colon:
+            self.wrapper_colon = True
+        elif ch == "[" and self.wrapper_colon:
+            self.state = "array"
+        else:
+            raise MalformedReplyError("wrapper object does not hold a list of rows")
+        self.pos += 1
 
-        # Cache dataframes for column width adjustment
-        generated_dfs = {}
+    def _begin_row(self):
+        self.state = "row"
+        self.row_start = self.pos
+        self.depth = 0
+        self.expect_key = False
+        self.key_start = None
+        self.row_has_field = False
 
-        # Create GPT session context
-        conversation = get_base_messages(pdf_text)
+    def _scan_row(self, ch, rows):
+        self.pos += 1
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                if self.key_start is not None:
+                    key_text = self.buffer[self.key_start:self.pos]
+                    self.key_start = None
+                    self._check_key(key_text)
+        elif ch == '"':
+            self.in_string = True
+            if self.depth == 1 and self.expect_key:
+                self.key_start = self.pos - 1
+                self.expect_key = False
+        elif ch == "," and self.depth == 1:
+            self.expect_key = True
+        elif ch in "{[":
+            if self.depth >= 1:
+                raise MalformedReplyError("row contains nested values")
+            self.depth += 1
+            self.expect_key = True
+        elif ch in "}]":
+            self.depth -= 1
+            if self.depth == 0:
+                rows.append(self._parse_row(self.buffer[self.row_start:self.pos]))
+                self.state = "done" if self.single_object else "array"
+                self.expect_row = False
+                self.row_count += 1
 
-        # --- Write updated data to Excel ---
-        with pd.ExcelWriter(updated_file, engine='openpyxl') as writer:
-            for sheet in sheets_to_process:
-                if sheet not in xls.sheet_names:
+    def _check_key(self, key_text):
+        try:
+            key = json.loads(key_text)
+        except json.JSONDecodeError as e:
+            raise MalformedReplyError(f"invalid key: {e}")
+        if not self.fields or key in self.fields:
+            self.row_has_field = True
+        elif self.row_has_field:
+            pass  # extra keys after a worksheet field are kept, as in the non-streaming path
+        elif self.single_object and self.row_count == 0:
+            # {"person": [...]}: read the rows inside the wrapper instead
+            self.state = "wrapper"
+            self.single_object = False
+            self.wrapped = True
+        else:
+            raise MalformedReplyError(f"row starts with {key!r}, which is not a worksheet field")
+
+    def _parse_row(self, text):
+        try:
+            row = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise MalformedReplyError(f"invalid row: {e}")
+        if not isinstance(row, dict):
+            raise MalformedReplyError("row is not a JSON object")
+        if self.fields and not self.fields.intersection(row):
+            raise MalformedReplyError(f"row has none of the worksheet fields: {list(row)[:5]}")
+        if self.single_object:
+            # Same shape as the non-streaming path: template fields only
+            return {col: row.get(col, "Not Provided") for col in self.field_order}
+        return row
+
+
+class SheetRowWriter:
+    """Appends rows to a worksheet as soon as they are parsed."""
+
+    def __init__(self, book, sheet_name, fields):
+        self.ws = book.create_sheet(sheet_name)
+        self.fields = list(fields)
+        self.columns = list(fields)
+        self.rows = []
+        self.ws.append(self.columns)
+
+    def add(self, row):
+        for key in row:
+            if key not in self.columns:
+                self.columns.append(key)
+                self.ws.cell(row=1, column=len(self.columns), value=key)
+        self.ws.append([row.get(col) for col in self.columns])
+        self.rows.append(row)
+
+    def reset(self):
+        if self.ws.max_row > 1:
+            self.ws.delete_rows(2, self.ws.max_row - 1)
+        # Drop header cells for extra keys that only the rejected reply had
+        if len(self.columns) > len(self.fields):
+            self.ws.delete_cols(len(self.fields) + 1, len(self.columns) - len(self.fields))
+        self.columns = list(self.fields)
+        self.rows = []
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+
+def stream_gpt_rows_for_sheet(messages, sheet_name, fields, sink):
+    """
+    Streaming variant of query_gpt_for_sheet. Rows are passed to sink.add()
+    as they complete; if the reply turns out malformed, generation is stopped
+    at once, sink.reset() is called and the question is asked again.
+    Returns the rows, or None if every attempt was malformed.
+    """
+    messages.append({"role": "user", "content": get_field_prompt(sheet_name, fields)})
+    reply = ""
+    for attempt in range(1, stream_max_attempts + 1):
+        parser = IncrementalRowParser(fields)
+        rows = []
+        parts = []
+        stream = client.chat.completions.create(
+            model="o3",
+            messages=messages,
+            temperature=1,
+            max_completion_tokens=32768,
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
                     continue
+                parts.append(chunk.choices[0].delta.content)
+                for row in parser.feed(parts[-1]):
+                    rows.append(row)
+                    sink.add(row)
+                if parser.done:
+                    break  # anything after the JSON is not needed
+            parser.close()
+        except MalformedReplyError as e:
+            reply = "".join(parts).strip()
+            print(f"⚠️ Attempt {attempt}/{stream_max_attempts} for sheet '{sheet_name}' stopped early: {e}")
+            sink.reset()
+            continue
+        finally:
+            stream.close()  # stops generation if we broke out early
 
-                df_headers = pd.read_excel(xls, sheet_name=sheet, engine='openpyxl', nrows=0)
-                fields = df_headers.columns.tolist()
+        reply = "".join(parts).strip()
+        messages.append({"role": "assistant", "content": reply})
+        return rows
 
-                print(f"🔍 Extracting metadata for sheet: {sheet}")
-                gpt_response = query_gpt_for_sheet(conversation, sheet, fields)
+    messages.append({"role": "assistant", "content": reply})
+    return None
 
-                try:
-                    metadata = json.loads(gpt_response)
-                except json.JSONDecodeError:
-                    print(f"⚠️ Warning: Failed to parse GPT response for sheet '{sheet}'. Response:\n{gpt_response}")
-                    metadata = [{col: "Not Provided" for col in fields}]
 
-                if isinstance(metadata, list):
-                    new_df = pd.DataFrame(metadata)
-                else:
-                    new_df = pd.DataFrame([{col: metadata.get(col, "Not Provided") for col in fields}])
+# --- Template parsing ---
+def load_template_fields(template_path):
+    """Return {sheet: [column headers]} for the sheets to process, in order."""
+    xls = pd.ExcelFile(template_path)
+    template_fields = {}
+    for sheet in sheets_to_process:
+        if sheet not in xls.sheet_names:
+            continue
+        df_headers = pd.read_excel(xls, sheet_name=sheet, engine='openpyxl', nrows=0)
+        template_fields[sheet] = df_headers.columns.tolist()
+    return template_fields
 
-                new_df.to_excel(writer, sheet_name=sheet, index=False)
-                generated_dfs[sheet] = new_df
 
-            if not generated_dfs:
-                raise RuntimeError("❌ No sheets were processed. Check API key or GPT responses.")
+# --- Per-PDF process ---
+def process_pdf(file, template_fields=None, stream=False):
+    if template_fields is None:
+        template_fields = load_template_fields(excel_file)
+    updated_file = Path("completed_manifests/" + str(file.name)).with_suffix(".xlsx")
+    pdf_file = file
+    pdf_text = extract_pdf_text(pdf_file)
 
-        # print(f"✅ Metadata inserted and saved to {updated_file}")
+    # Cache dataframes for column width adjustment
+    generated_dfs = {}
 
-        # --- Adjust column widths and ensure sheets are visible ---
-        wb = load_workbook(updated_file)
+    # Create GPT session context
+    conversation = get_base_messages(pdf_text)
 
-        for sheet_name, df in generated_dfs.items():
-            if sheet_name not in wb.sheetnames:
+    # --- Write updated data to Excel ---
+    with pd.ExcelWriter(updated_file, engine='openpyxl') as writer:
+        for sheet, fields in template_fields.items():
+            print(f"🔍 Extracting metadata for sheet: {sheet}")
+            if stream:
+                sheet_writer = SheetRowWriter(writer.book, sheet, fields)
+                if stream_gpt_rows_for_sheet(conversation, sheet, fields, sheet_writer) is None:
+                    print(f"⚠️ Warning: No valid GPT response for sheet '{sheet}' after {stream_max_attempts} attempts.")
+                    sheet_writer.add({col: "Not Provided" for col in fields})
+                generated_dfs[sheet] = sheet_writer.to_dataframe()
                 continue
 
-            ws = wb[sheet_name]
-            ws.sheet_state = "visible"
-
-            for i, column in enumerate(df.columns, start=1):
-                max_len = max(df[column].astype(str).map(len).max(), len(str(column)))
-                col_letter = get_column_letter(i)
-                ws.column_dimensions[col_letter].width = max_len + 2
-
-        # --- Ensure at least one sheet is visible ---
-        if not any(wb[s].sheet_state == "visible" for s in wb.sheetnames):
-            wb[wb.sheetnames[0]].sheet_state = "visible"
-
-        wb.save(updated_file)
-        # Move the processed PDF to the 'done' folder
-        done_path = Path("done") / file.name
-        done_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure 'done' directory exists
-        shutil.move(str(file), str(done_path))
-        print(f"moved {file.name} to {done_path}")
-        print(f"🎉 All done! Updated file saved to: {updated_file}\n\n")
+            gpt_response = query_gpt_for_sheet(conversation, sheet, fields)
+
+            try:
+                metadata = json.loads(gpt_response)
+            except json.JSONDecodeError:
+                print(f"⚠️ Warning: Failed to parse GPT response for sheet '{sheet}'. Response:\n{gpt_response}")
+                metadata = [{col: "Not Provided" for col in fields}]
+
+            if isinstance(metadata, list):
+                new_df = pd.DataFrame(metadata)
+            else:
+                new_df = pd.DataFrame([{col: metadata.get(col, "Not Provided") for col in fields}])
+
+            new_df.to_excel(writer, sheet_name=sheet, index=False)
+            generated_dfs[sheet] = new_df
+
+        if not generated_dfs:
+            raise RuntimeError("❌ No sheets were processed. Check API key or GPT responses.")
+
+    # print(f"✅ Metadata inserted and saved to {updated_file}")
+
+    # --- Adjust column widths and ensure sheets are visible ---
+    wb = load_workbook(updated_file)
+
+    for sheet_name, df in generated_dfs.items():
+        if sheet_name not in wb.sheetnames:
+            continue
+
+        ws = wb[sheet_name]
+        ws.sheet_state = "visible"
+
+        for i, column in enumerate(df.columns, start=1):
+            # An empty reply ([]) leaves the column without values to measure
+            data_len = 0 if df.empty else df[column].astype(str).map(len).max()
+            max_len = max(data_len, len(str(column)))
+            col_letter = get_column_letter(i)
+            ws.column_dimensions[col_letter].width = max_len + 2
+
+    # --- Ensure at least one sheet is visible ---
+    if not any(wb[s].sheet_state == "visible" for s in wb.sheetnames):
+        wb[wb.sheetnames[0]].sheet_state = "visible"
+
+    wb.save(updated_file)
+    # Move the processed PDF to the 'done' folder
+    done_path = Path("done") / file.name
+    done_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure 'done' directory exists
+    shutil.move(str(file), str(done_path))
+    print(f"moved {file.name} to {done_path}")
+    print(f"🎉 All done! Updated file saved to: {updated_file}\n\n")
+
+
+# --- Input discovery ---
+def pending_pdfs(input_pdf_path):
+    for file in input_pdf_path.iterdir():
+        if file.is_file() and ".DS_Store" not in file.name:
+            yield file
+
+
+# --- Watch mode ---
+def watch(input_pdf_path, template_fields, interval=1.0, stream=False):
+    """
+    Poll the input folder and extract each PDF as soon as it has finished
+    being written (same size and mtime on two consecutive polls). The OpenAI
+    client, its connection pool and the parsed template stay loaded between
+    papers, so only the first paper pays the start-up cost.
+    """
+    last_seen = {}   # path -> (size, mtime) at the previous poll
+    failed = {}      # path -> (size, mtime) that failed; retried only once the file changes
+    print(f"👀 Watching {input_pdf_path}/ for new PDFs (polling every {interval}s, CTRL+C to stop)")
+    try:
+        while True:
+            current = {}
+            for file in pending_pdfs(input_pdf_path):
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue  # moved away between listing and stat
+                current[file] = (stat.st_size, stat.st_mtime_ns)
+
+            for file, signature in current.items():
+                if last_seen.get(file) != signature or failed.get(file) == signature:
+                    continue  # still being written, or unchanged since it failed
+                try:
+                    process_pdf(file, template_fields, stream)
+                    failed.pop(file, None)
+                except Exception as e:
+                    print(f"❌ Failed to process {file.name}: {e}")
+                    failed[file] = signature
+
+            last_seen = current
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("👋 Stopped watching.")
+
+
+# --- Main process ---
+def main():
+    parser = argparse.ArgumentParser(description="Extract single-cell metadata from PDFs in pdfs/ into Excel manifests.")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and process new PDFs as they arrive in pdfs/")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="polling interval in seconds for --watch (default: 1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream GPT replies, writing rows as they arrive and retrying malformed replies early")
+    args = parser.parse_args()
+
+    input_pdf_path = Path("pdfs")
+    template_fields = load_template_fields(excel_file)
+    if args.watch:
+        input_pdf_path.mkdir(exist_ok=True)
+        watch(input_pdf_path, template_fields, args.interval, args.stream)
+        return
+
+    for file in list(pending_pdfs(input_pdf_path)):
+        process_pdf(file, template_fields, args.stream)
+
+
+if __name__ == "__main__":
+    main()
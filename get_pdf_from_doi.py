@@ -10,6 +10,11 @@ EMAIL = "felix.shaw@earlham.ac.uk"  # REQUIRED for Unpaywall
 OUTPUT_DIR = "pdfs"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Service endpoints (overridable so the scripts can be pointed at local mocks)
+UNPAYWALL_API_URL = os.getenv("UNPAYWALL_API_URL", "https://api.unpaywall.org/v2")
+DOI_RESOLVER_URL = os.getenv("DOI_RESOLVER_URL", "https://doi.org")
+POLITE_DELAY = 1  # seconds to wait between DOIs
+
 DOIS = [
     "10.3389/fpls.2024.1274013",
     "10.1186/s13059-023-02908-x",
@@ -33,7 +38,7 @@ HEADERS = {"User-Agent": "Mozilla/5.0"}
 # ========== STEP 1: Try Unpaywall ==========
 def get_pdf_url_unpaywall(doi):
     try:
-        url = f"https://api.unpaywall.org/v2/{quote(doi)}?email={EMAIL}"
+        url = f"{UNPAYWALL_API_URL}/{quote(doi)}?email={EMAIL}"
         r = requests.get(url, timeout=10)
         if r.status_code == 200:
             data = r.json()
@@ -47,7 +52,7 @@ def get_pdf_url_unpaywall(doi):
 
 # ========== STEP 2: Try to extract PDF link from publisher site ==========
 def get_pdf_link_from_doi_page(doi):
-    doi_url = f"https://doi.org/{doi}"
+    doi_url = f"{DOI_RESOLVER_URL}/{doi}"
     try:
         r = requests.get(doi_url, headers=HEADERS, timeout=15, allow_redirects=True)
         r.raise_for_status()
@@ -81,8 +86,8 @@ def download_pdf(pdf_url, output_path):
     return False
 
 
-# ========== MAIN LOOP ==========
-for doi in DOIS:
+# ========== PER-DOI PIPELINE ==========
+def fetch_pdf_for_doi(doi):
     print(f"\n🔍 Processing DOI: {doi}")
     filename = os.path.join(OUTPUT_DIR, doi.replace('/', '_') + ".pdf")
 
@@ -91,14 +96,22 @@ for doi in DOIS:
     if pdf_url:
         print(f"📦 Found via Unpaywall: {pdf_url}")
         if download_pdf(pdf_url, filename):
-            continue  # Success
+            return True  # Success
 
     # Try fallback via publisher site
     pdf_url = get_pdf_link_from_doi_page(doi)
+    success = False
     if pdf_url:
         print(f"📦 Found on publisher site: {pdf_url}")
-        download_pdf(pdf_url, filename)
+        success = download_pdf(pdf_url, filename)
     else:
         print(f"❌ No PDF found for {doi}")
 
-    sleep(1)  # Polite delay
\ No newline at end of file
+    sleep(POLITE_DELAY)  # Polite delay
+    return success
+
+
+# ========== MAIN LOOP ==========
+if __name__ == "__main__":
+    for doi in DOIS:
+        fetch_pdf_for_doi(doi)
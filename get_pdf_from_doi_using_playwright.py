@@ -1,5 +1,9 @@
 import os
 import re
+import json
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     from playwright.sync_api import sync_playwright
@@ -41,6 +45,18 @@ SCREENSHOT_DIR = "screenshots"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(SCREENSHOT_DIR, exist_ok=True)
 
+# Where DOIs are resolved (overridable so the script can be pointed at local mocks)
+DOI_RESOLVER_URL = os.getenv("DOI_RESOLVER_URL", "https://doi.org")
+
+# Show the browser window while downloading
+HEADLESS = False
+
+# Failure diagnostics (written to SCREENSHOT_DIR when no PDF is found)
+DIAGNOSTICS_JPEG_QUALITY = 60        # viewport-only JPEG instead of a full-page PNG
+DIAGNOSTICS_SAVE_DOM = False         # also save a trimmed DOM + link dump
+DIAGNOSTICS_DOM_MAX_CHARS = 100_000  # cap on the saved HTML
+DIAGNOSTICS_MAX_RECORDS = 500        # retention cap; older records and their files are removed
+
 # ---------------------------------------------------------------------------
 #  Selectors
 # ---------------------------------------------------------------------------
@@ -85,6 +101,22 @@ COOKIE_ACCEPT_SELECTORS = [
     '[data-track-action="download pdf"]',
 ]
 
+# Runs in the page: links/viewers plus the HTML without scripts, styles and SVGs
+DOM_DUMP_JS = """
+(maxChars) => {
+    const links = Array.from(document.querySelectorAll('a[href], iframe[src], embed[src]'))
+        .slice(0, 300)
+        .map(el => ({
+            tag: el.tagName.toLowerCase(),
+            text: (el.innerText || el.title || '').trim().slice(0, 120),
+            href: el.href || el.src,
+        }));
+    const clone = document.documentElement.cloneNode(true);
+    clone.querySelectorAll('script, style, noscript, svg, link, meta').forEach(el => el.remove());
+    return {url: location.href, title: document.title, links, html: clone.outerHTML.slice(0, maxChars)};
+}
+"""
+
 # ---------------------------------------------------------------------------
 #  Helper functions
 # ---------------------------------------------------------------------------
@@ -113,17 +145,124 @@ def _accept_cookie_banner(page) -> None:
                 pass
 
 
+# ---------------------------------------------------------------------------
+#  Failure diagnostics
+# ---------------------------------------------------------------------------
+
+class DiagnosticsStore:
+    """
+    Keeps what is needed to triage DOIs whose PDF could not be fetched.
+
+    Screenshots (and optional DOM dumps) are stored under the SHA-256 of their
+    content, so identical pages seen again, in this run or a later one, reuse
+    the same file. Every failure is appended to ``index.jsonl`` (time, DOI,
+    final URL, reason, artefact names); only the newest ``max_records`` are
+    kept and artefacts no longer referenced are deleted. Hashing and disk I/O
+    happen on a background thread so the next DOI can start straight away.
+    """
+
+    def __init__(self, directory: str, max_records: int = DIAGNOSTICS_MAX_RECORDS):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.max_records = max_records
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagnostics")
+
+    def record_failure(self, page, doi: str, reason: str) -> None:
+        """Grab the artefacts from the page (must run before the browser closes) and queue them."""
+        screenshot = dom = None
+        try:
+            screenshot = page.screenshot(
+                type="jpeg", quality=DIAGNOSTICS_JPEG_QUALITY, full_page=False
+            )
+        except Exception as e:
+            print(f"⚠️  Screenshot failed: {e}")
+        if DIAGNOSTICS_SAVE_DOM:
+            try:
+                dump = page.evaluate(DOM_DUMP_JS, DIAGNOSTICS_DOM_MAX_CHARS)
+                dom = json.dumps(dump, ensure_ascii=False, indent=1).encode("utf-8")
+            except Exception as e:
+                print(f"⚠️  DOM dump failed: {e}")
+
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "doi": doi,
+            "url": page.url,
+            "reason": reason,
+        }
+        try:
+            self._executor.submit(self._save, record, screenshot, dom)
+        except RuntimeError:
+            # close() has already been called: save on this thread instead
+            self._save(record, screenshot, dom)
+
+    def close(self) -> None:
+        """Wait for queued diagnostics to be written."""
+        self._executor.shutdown(wait=True)
+
+    def _save(self, record: dict, screenshot, dom) -> None:
+        try:
+            record["screenshot"] = self._store_blob(screenshot, ".jpg")
+            record["dom"] = self._store_blob(dom, ".json")
+
+            records = self._read_index() + [record]
+            # Slice from the front: records[-0:] would keep everything when max_records is 0
+            split = max(len(records) - self.max_records, 0)
+            dropped, kept = records[:split], records[split:]
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in kept)
+            os.replace(tmp_path, self.index_path)
+
+            in_use = {r.get(key) for r in kept for key in ("screenshot", "dom")}
+            for r in dropped:
+                for key in ("screenshot", "dom"):
+                    name = r.get(key)
+                    if name and name not in in_use:
+                        try:
+                            os.remove(os.path.join(self.directory, name))
+                        except FileNotFoundError:
+                            pass
+            print(f"📸 Diagnostics for {record['doi']} saved: {record['screenshot'] or 'no screenshot'}")
+        except Exception as e:
+            print(f"⚠️  Failed to save diagnostics for {record['doi']}: {e}")
+
+    def _store_blob(self, data, suffix: str):
+        if data is None:
+            return None
+        name = hashlib.sha256(data).hexdigest()[:16] + suffix
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.utime(path)  # already stored by an earlier failure
+            return name
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return name
+
+    def _read_index(self) -> list:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+diagnostics = DiagnosticsStore(SCREENSHOT_DIR)
+
+
 # ---------------------------------------------------------------------------
 #  Main routine
 # ---------------------------------------------------------------------------
 
-def download_pdf_with_playwright(doi: str) -> None:
+def download_pdf_with_playwright(doi: str) -> bool:
     """
     Navigate to a DOI landing page and try to obtain the corresponding PDF,
     accepting cookie banners automatically along the way.
+    Returns True if a PDF was saved.
     """
     with sync_playwright() as p:
-        browser = p.firefox.launch(headless=False)
+        browser = p.firefox.launch(headless=HEADLESS)
         context = browser.new_context(
             accept_downloads=True,
             user_agent=(
@@ -149,7 +288,7 @@ def download_pdf_with_playwright(doi: str) -> None:
 
         context.route("**/*", log_pdf_requests)
 
-        doi_url = f"https://doi.org/{doi}"
+        doi_url = f"{DOI_RESOLVER_URL}/{doi}"
         safe_filename = make_safe_filename(doi)
 
         try:
@@ -159,7 +298,7 @@ def download_pdf_with_playwright(doi: str) -> None:
         except Exception as e:
             print(f"❌ Failed to load DOI page: {e}")
             browser.close()
-            return
+            return False
 
         # -------------------------------------------------------------------
         # 1. Try to click explicit “download PDF” links/buttons
@@ -200,18 +339,17 @@ def download_pdf_with_playwright(doi: str) -> None:
                 print(f"⚠️  Intercepted URL fetch failed: {e}")
 
         # -------------------------------------------------------------------
-        # 3. If still unsuccessful, take a full-page screenshot for inspection
+        # 3. If still unsuccessful, record diagnostics for inspection
         # -------------------------------------------------------------------
         if not download_success:
-            screenshot_path = os.path.join(
-                SCREENSHOT_DIR, f"{safe_filename}.png"
+            reason = (
+                "intercepted PDF URL could not be fetched" if intercepted_pdf_urls
+                else "no PDF link, download or viewer found"
             )
-            try:
-                page.screenshot(path=screenshot_path, full_page=True)
-                print(f"❌ PDF not found. 📸 Screenshot saved to {screenshot_path}")
-            except Exception as e:
-                print(e)
+            diagnostics.record_failure(page, doi, reason)
+            print(f"❌ PDF not found ({reason}). 📸 Diagnostics queued in {SCREENSHOT_DIR}/")
         browser.close()
+        return download_success
 
 
 # ---------------------------------------------------------------------------
@@ -219,4 +357,5 @@ def download_pdf_with_playwright(doi: str) -> None:
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
     for doi in DOIS:
-        download_pdf_with_playwright(doi)
\ No newline at end of file
+        download_pdf_with_playwright(doi)
+    diagnostics.close()
\ No newline at end of file